@@ -1,17 +1,30 @@
 #!/usr/bin/env python3
 import argparse
 import csv
+import io
 import json
 import os
 import shutil
 import subprocess
-from dataclasses import dataclass
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, is_dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
+from typing import Optional, TextIO, Tuple
 
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
 
-@dataclass
+
+# dataclass(slots=True) needs Python 3.10; older interpreters get a plain dataclass.
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**DATACLASS_SLOTS)
 class ConversionResult:
     source: str
     target: str
@@ -19,6 +32,7 @@ class ConversionResult:
     error: str = ""
 
 
+@lru_cache(maxsize=None)
 def find_ffmpeg() -> Optional[str]:
     env_ffmpeg = os.environ.get("FFMPEG_BINARY")
     if env_ffmpeg and Path(env_ffmpeg).exists():
@@ -35,51 +49,120 @@ def find_ffmpeg() -> Optional[str]:
     return None
 
 
-def convert_file(src: Path, dst: Path, ffmpeg_bin: str) -> ConversionResult:
-    if dst.exists():
-        return ConversionResult(
-            source=str(src),
-            target=str(dst),
-            status="skipped",
-            error="target_exists",
-        )
-
-    cmd = [
-        ffmpeg_bin,
-        "-y",
-        "-i",
-        str(src),
-        "-vn",
+def scan_sources(input_dir: Path) -> Tuple[list[str], list[str]]:
+    """Walk input_dir once and split .m4a paths into (pending, already converted).
+
+    A source counts as converted when a sibling .mp3 with the same stem was
+    seen in the same directory listing, so no extra stat() per file is needed.
+    Paths stay plain strings here; callers wrap the ones they convert.
+    """
+    pending: list[str] = []
+    converted: list[str] = []
+    stack = [str(input_dir)]
+    while stack:
+        directory = stack.pop()
+        m4a_names: list[str] = []
+        mp3_names: set[str] = set()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".m4a"):
+                    m4a_names.append(entry.name)
+                elif entry.name.endswith(".mp3"):
+                    mp3_names.add(entry.name)
+        for name in m4a_names:
+            src = os.path.join(directory, name)
+            if name[: -len(".m4a")] + ".mp3" in mp3_names:
+                converted.append(src)
+            else:
+                pending.append(src)
+    return sorted(pending), sorted(converted)
+
+
+@dataclass(frozen=True)
+class EncoderOptions:
+    threads: int = 2
+    # LAME VBR quality for -q:a: 0 is best and slowest, 9 is smallest and fastest.
+    quality: int = 2
+    # Try a stream copy before re-encoding. This only succeeds when the .m4a
+    # already carries MP3 audio; AAC sources fall back to libmp3lame.
+    copy_when_possible: bool = False
+
+
+FFMPEG_BASE_ARGS = ["-nostats", "-loglevel", "error", "-filter_threads", "1", "-y"]
+
+
+def input_args(src: Path, options: EncoderOptions) -> list[str]:
+    # -threads before -i bounds the decoder; libmp3lame itself is single-threaded.
+    return ["-threads", str(options.threads), "-i", str(src)]
+
+
+def mp3_output_args(dst: Path, options: EncoderOptions, copy: bool = False) -> list[str]:
+    if copy:
+        return ["-codec:a", "copy", str(dst)]
+    return [
+        "-threads",
+        str(options.threads),
         "-codec:a",
         "libmp3lame",
         "-q:a",
-        "2",
+        str(options.quality),
         str(dst),
     ]
 
+
+def run_ffmpeg(cmd: list[str]) -> Optional[str]:
+    """Run an ffmpeg command and return an error message, or None on success."""
     try:
         completed = subprocess.run(
             cmd,
-            capture_output=True,
-            text=True,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             check=False,
         )
     except Exception as exc:
+        return str(exc)
+
+    if completed.returncode == 0:
+        return None
+
+    stderr = completed.stderr.decode("utf-8", errors="replace") if completed.stderr else ""
+    return stderr.strip() or f"ffmpeg exited with code {completed.returncode}"
+
+
+def convert_file(
+    src: Path, dst: Path, ffmpeg_bin: str, options: EncoderOptions = EncoderOptions()
+) -> ConversionResult:
+    if dst.exists():
         return ConversionResult(
             source=str(src),
             target=str(dst),
-            status="failed",
-            error=str(exc),
+            status="skipped",
+            error="target_exists",
         )
 
-    if completed.returncode == 0:
+    cmd = [ffmpeg_bin, *FFMPEG_BASE_ARGS, *input_args(src, options), "-vn"]
+    if options.copy_when_possible:
+        if run_ffmpeg(cmd + mp3_output_args(dst, options, copy=True)) is None:
+            return ConversionResult(
+                source=str(src),
+                target=str(dst),
+                status="converted",
+            )
+        dst.unlink(missing_ok=True)
+
+    err = run_ffmpeg(cmd + mp3_output_args(dst, options))
+    if err is None:
         return ConversionResult(
             source=str(src),
             target=str(dst),
             status="converted",
         )
 
-    err = (completed.stderr or "").strip() or f"ffmpeg exited with code {completed.returncode}"
+    # Drop any partial output so the next run retries instead of skipping it.
+    dst.unlink(missing_ok=True)
     return ConversionResult(
         source=str(src),
         target=str(dst),
@@ -88,45 +171,145 @@ def convert_file(src: Path, dst: Path, ffmpeg_bin: str) -> ConversionResult:
     )
 
 
-def ensure_ffmpeg() -> Optional[str]:
+def convert_batch(
+    sources: list[Path], ffmpeg_bin: str, options: EncoderOptions = EncoderOptions()
+) -> list[ConversionResult]:
+    """Convert several files with one ffmpeg process, one output per input.
+
+    If the batch run fails, its partial outputs are removed and every file is
+    retried on its own, so a single bad input only fails itself.
+    """
+    if len(sources) == 1:
+        return [convert_file(sources[0], sources[0].with_suffix(".mp3"), ffmpeg_bin, options)]
+
+    results: list[ConversionResult] = []
+    pairs: list[Tuple[Path, Path]] = []
+    for src in sources:
+        dst = src.with_suffix(".mp3")
+        if dst.exists():
+            results.append(
+                ConversionResult(
+                    source=str(src),
+                    target=str(dst),
+                    status="skipped",
+                    error="target_exists",
+                )
+            )
+        else:
+            pairs.append((src, dst))
+
+    if not pairs:
+        return results
+
+    attempts = [True, False] if options.copy_when_possible else [False]
+    for copy in attempts:
+        cmd = [ffmpeg_bin, *FFMPEG_BASE_ARGS]
+        for src, _ in pairs:
+            cmd.extend(input_args(src, options))
+        for index, (_, dst) in enumerate(pairs):
+            cmd.extend(["-map", f"{index}:a:0", *mp3_output_args(dst, options, copy=copy)])
+
+        if run_ffmpeg(cmd) is None and all(dst.exists() for _, dst in pairs):
+            results.extend(
+                ConversionResult(source=str(src), target=str(dst), status="converted")
+                for src, dst in pairs
+            )
+            return results
+
+        for _, dst in pairs:
+            dst.unlink(missing_ok=True)
+
+    for src, dst in pairs:
+        results.append(convert_file(src, dst, ffmpeg_bin, options))
+    return results
+
+
+def ensure_ffmpeg() -> Tuple[Optional[str], Optional[str]]:
     ffmpeg_path = find_ffmpeg()
     if ffmpeg_path:
-        return None
-    return (
+        return ffmpeg_path, None
+    return None, (
         "ffmpeg not found. Install with Homebrew (`brew install ffmpeg`) or set "
         "FFMPEG_BINARY to the full ffmpeg path."
     )
 
 
-def write_json_report(report_path: Path, run_payload: dict) -> None:
+def compact_json(obj: object) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    if is_dataclass(obj):
+        obj = asdict(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def write_json_report(
+    report_path: Path, run_payload: dict, results: list[ConversionResult]
+) -> None:
+    """Record one run in the report history.
+
+    run_payload holds the run metadata; results are added to it under
+    "results". A .jsonl path gets one compact line appended per run, with
+    results encoded one at a time rather than copied into a list of dicts,
+    and the line written in a single call so the history never holds a
+    partial run. Any other suffix keeps the legacy single JSON document with
+    a "runs" list, which has to be re-read and rewritten on every run.
+    """
     report_path.parent.mkdir(parents=True, exist_ok=True)
 
+    if report_path.suffix == ".jsonl":
+        pieces = [b"{"]
+        for key, value in run_payload.items():
+            pieces += [compact_json(key), b":", compact_json(value), b","]
+        pieces.append(b'"results":[')
+        for index, r in enumerate(results):
+            if index:
+                pieces.append(b",")
+            pieces.append(compact_json(r))
+        pieces.append(b"]}\n")
+        line = b"".join(pieces)
+        del pieces
+        with report_path.open("ab") as f:
+            f.write(line)
+        return
+
+    run_payload = {**run_payload, "results": [asdict(r) for r in results]}
+
     if report_path.exists():
         try:
-            existing = json.loads(report_path.read_text(encoding="utf-8"))
+            if orjson is not None:
+                existing = orjson.loads(report_path.read_bytes())
+            else:
+                existing = json.loads(report_path.read_text(encoding="utf-8"))
         except json.JSONDecodeError:
             existing = {"runs": []}
     else:
         existing = {"runs": []}
 
     existing.setdefault("runs", []).append(run_payload)
-    report_path.write_text(json.dumps(existing, indent=2), encoding="utf-8")
-
-
-def write_csv_report(csv_path: Path, results: list[ConversionResult]) -> None:
-    csv_path.parent.mkdir(parents=True, exist_ok=True)
-    with csv_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["source", "target", "status", "error"])
-        writer.writeheader()
-        for r in results:
-            writer.writerow(
-                {
-                    "source": r.source,
-                    "target": r.target,
-                    "status": r.status,
-                    "error": r.error,
-                }
-            )
+    if orjson is not None:
+        report_path.write_bytes(orjson.dumps(existing, option=orjson.OPT_INDENT_2))
+    else:
+        report_path.write_text(json.dumps(existing, indent=2), encoding="utf-8")
+
+
+CSV_FIELDS = ["source", "target", "status", "error"]
+
+
+def write_csv_rows(f: TextIO, results: list[ConversionResult]) -> None:
+    """Append result rows to an open CSV report in one write and flush them."""
+    buf = io.StringIO(newline="")
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS)
+    for r in results:
+        writer.writerow(
+            {
+                "source": r.source,
+                "target": r.target,
+                "status": r.status,
+                "error": r.error,
+            }
+        )
+    f.write(buf.getvalue())
+    f.flush()
 
 
 def main() -> int:
@@ -140,14 +323,60 @@ def main() -> int:
     )
     parser.add_argument(
         "--report-json",
-        default="data/train/conversion_report.json",
-        help="Path for JSON report history",
+        default="data/train/conversion_report.jsonl",
+        help=(
+            "Path for report history. A .jsonl path is appended one run per line; "
+            "a .json path keeps the legacy single-document format"
+        ),
     )
     parser.add_argument(
         "--report-csv",
         default="data/train/last_conversion_report.csv",
         help="Path for CSV report of the latest run",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=max(1, (os.cpu_count() or 2) // 2),
+        help="Number of ffmpeg processes to run in parallel (default: half the CPU count)",
+    )
+    parser.add_argument(
+        "--ffmpeg-threads",
+        type=int,
+        help=(
+            "Decoder threads per ffmpeg process; the MP3 encoder itself is "
+            "single-threaded (default: 2, or fewer so that jobs * ffmpeg_threads "
+            "fits the CPU count). Larger values than the CPUs allow are clamped"
+        ),
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        choices=range(10),
+        default=2,
+        metavar="{0-9}",
+        help=(
+            "LAME VBR quality passed as -q:a (default: 2, about 190 kbps). Higher "
+            "values encode faster into smaller files, e.g. 4 is about 165 kbps"
+        ),
+    )
+    parser.add_argument(
+        "--copy-when-possible",
+        action="store_true",
+        help=(
+            "Try copying the audio stream before re-encoding. Only .m4a files that "
+            "already contain MP3 audio can be copied; others are re-encoded"
+        ),
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1,
+        help=(
+            "Number of files each ffmpeg process converts, to amortize process "
+            "startup on many short clips (default: 1)"
+        ),
+    )
 
     args = parser.parse_args()
     input_dir = Path(args.input_dir)
@@ -158,22 +387,86 @@ def main() -> int:
         print(f"Input directory does not exist: {input_dir}")
         return 1
 
-    ffmpeg_error = ensure_ffmpeg()
-    if ffmpeg_error:
-        print(ffmpeg_error)
+    if args.jobs < 1:
+        print(f"--jobs must be at least 1, got {args.jobs}")
         return 1
-    ffmpeg_bin = find_ffmpeg()
+
+    if args.ffmpeg_threads is not None and args.ffmpeg_threads < 1:
+        print(f"--ffmpeg-threads must be at least 1, got {args.ffmpeg_threads}")
+        return 1
+
+    cpu_count = os.cpu_count() or 1
+    max_threads = max(1, cpu_count // args.jobs)
+    if args.ffmpeg_threads is None:
+        ffmpeg_threads = min(2, max_threads)
+    else:
+        ffmpeg_threads = min(args.ffmpeg_threads, max_threads)
+    if args.ffmpeg_threads is not None and ffmpeg_threads != args.ffmpeg_threads:
+        print(
+            f"Clamping --ffmpeg-threads to {ffmpeg_threads} "
+            f"({args.jobs} jobs on {cpu_count} CPUs)"
+        )
+
+    if args.batch_size < 1:
+        print(f"--batch-size must be at least 1, got {args.batch_size}")
+        return 1
+
+    ffmpeg_bin, ffmpeg_error = ensure_ffmpeg()
     if ffmpeg_bin is None:
-        print("ffmpeg lookup failed unexpectedly")
+        print(ffmpeg_error)
         return 1
 
-    sources = sorted(input_dir.rglob("*.m4a"))
-    results: list[ConversionResult] = []
+    pending, already_converted = scan_sources(input_dir)
+    results: list[ConversionResult] = [
+        ConversionResult(
+            source=src,
+            target=src[: -len(".m4a")] + ".mp3",
+            status="skipped",
+            error="target_exists",
+        )
+        for src in already_converted
+    ]
 
-    for src in sources:
-        dst = src.with_suffix(".mp3")
-        result = convert_file(src, dst, ffmpeg_bin)
-        results.append(result)
+    options = EncoderOptions(
+        threads=ffmpeg_threads,
+        quality=args.quality,
+        copy_when_possible=args.copy_when_possible,
+    )
+    sources = [Path(src) for src in pending]
+    batches = [
+        sources[i : i + args.batch_size] for i in range(0, len(sources), args.batch_size)
+    ]
+    print(f"Found: {len(results) + len(sources)} .m4a files")
+    print(f"Using ffmpeg: {ffmpeg_bin}")
+
+    # The CSV is written as batches finish so an interrupted run still
+    # leaves a report of everything completed so far.
+    report_csv.parent.mkdir(parents=True, exist_ok=True)
+    with report_csv.open("w", newline="", encoding="utf-8") as csv_file:
+        csv.DictWriter(csv_file, fieldnames=CSV_FIELDS).writeheader()
+        write_csv_rows(csv_file, results)
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            try:
+                futures = [
+                    executor.submit(convert_batch, batch, ffmpeg_bin, options)
+                    for batch in batches
+                ]
+                for future in as_completed(futures):
+                    batch_results = future.result()
+                    results.extend(batch_results)
+                    write_csv_rows(csv_file, batch_results)
+                    done += len(batch_results)
+                    print(f"Processed {done}/{len(sources)}", flush=True)
+            except BaseException:
+                # On Ctrl-C or a worker error, drop queued batches instead of
+                # letting the pool's exit start ffmpeg for each of them.
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    # CSV rows follow completion order; the history keeps a stable order.
+    results.sort(key=lambda r: r.source)
 
     converted = sum(1 for r in results if r.status == "converted")
     skipped = sum(1 for r in results if r.status == "skipped")
@@ -188,22 +481,10 @@ def main() -> int:
             "skipped": skipped,
             "failed": failed,
         },
-        "results": [
-            {
-                "source": r.source,
-                "target": r.target,
-                "status": r.status,
-                "error": r.error,
-            }
-            for r in results
-        ],
     }
 
-    write_json_report(report_json, run_payload)
-    write_csv_report(report_csv, results)
+    write_json_report(report_json, run_payload, results)
 
-    print(f"Found: {len(results)} .m4a files")
-    print(f"Using ffmpeg: {ffmpeg_bin}")
     print(f"Converted: {converted}")
     print(f"Skipped: {skipped}")
     print(f"Failed: {failed}")
@@ -5,19 +5,66 @@ from __future__ import annotations
 
 import argparse
 import json
+import os
 import re
+import tempfile
 from pathlib import Path
+from typing import BinaryIO, Iterator
+
+try:
+    import orjson
+except ImportError:  # optional speedup; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # optional; without it the whole export is loaded at once
+    ijson = None
+
+
+_HASH_RE = re.compile(r"-([^/]+\.mp3)$", re.IGNORECASE)
 
 
 def extract_filename(value: str) -> str:
     """Extract a clean filename from hashed Label Studio names."""
-    base = Path(value).name
-    match = re.search(r"-([^/]+\.mp3)$", base, flags=re.IGNORECASE)
+    # Plain string splits instead of Path(value).name: this runs once per task.
+    base = value.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+    match = _HASH_RE.search(base)
     if match:
         return match.group(1)
     return base
 
 
+def ensure_task_array(f: BinaryIO) -> None:
+    """Fail early unless the export's top-level value is a JSON array."""
+    head = f.read(1)
+    while head.isspace():
+        head = f.read(1)
+    if head != b"[":
+        raise ValueError("Expected top-level JSON array of tasks")
+    f.seek(0)
+
+
+def iter_tasks(f: BinaryIO) -> Iterator[dict]:
+    """Yield tasks from a Label Studio export, streaming when ijson is available."""
+    if ijson is not None:
+        yield from ijson.items(f, "item", use_float=True)
+    elif orjson is not None:
+        yield from orjson.loads(f.read())
+    else:
+        yield from json.loads(f.read().decode("utf-8"))
+
+
+def encode_task(task: dict) -> bytes:
+    """Encode one task as it would appear inside an indent=2 top-level array."""
+    if orjson is not None:
+        encoded = orjson.dumps(task, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        encoded = json.dumps(task, ensure_ascii=False, indent=2).encode("utf-8")
+    # JSON strings never contain raw newlines, so this only shifts structure.
+    return b"  " + encoded.replace(b"\n", b"\n  ")
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Copy Label Studio JSON and remap audio filenames to local MP3 names."
@@ -41,31 +88,56 @@ def main() -> None:
 
     audio_dir = args.audio_dir or args.input_json.parent
 
-    with args.input_json.open("r", encoding="utf-8") as f:
-        tasks = json.load(f)
-
-    if not isinstance(tasks, list):
-        raise ValueError("Expected top-level JSON array of tasks")
+    # One directory listing up front instead of a stat() per task.
+    if audio_dir.is_dir():
+        with os.scandir(audio_dir) as entries:
+            existing = {entry.name for entry in entries}
+    else:
+        existing = set()
 
     missing_files = []
 
-    for task in tasks:
-        source_name = str(task.get("file_upload") or task.get("data", {}).get("audio", ""))
-        if not source_name:
-            continue
-
-        filename = extract_filename(source_name)
-
-        if not (audio_dir / filename).exists():
-            missing_files.append(filename)
-
-        task["file_upload"] = filename
-        task.setdefault("data", {})
-        task["data"]["audio"] = args.audio_url_template.format(filename=filename)
-
     args.output_json.parent.mkdir(parents=True, exist_ok=True)
-    with args.output_json.open("w", encoding="utf-8") as f:
-        json.dump(tasks, f, ensure_ascii=False, indent=2)
+    # Stream into a temp file next to the output and swap it in only once the
+    # array is complete, so a failed run never clobbers an existing output
+    # (which also makes rewriting the input in place safe).
+    tmp = tempfile.NamedTemporaryFile(
+        dir=args.output_json.parent,
+        prefix=f".{args.output_json.name}.",
+        suffix=".tmp",
+        delete=False,
+    )
+    try:
+        with tmp as out, args.input_json.open("rb") as src:
+            ensure_task_array(src)
+            out.write(b"[")
+            count = 0
+            for task in iter_tasks(src):
+                source_name = str(
+                    task.get("file_upload") or task.get("data", {}).get("audio", "")
+                )
+                if source_name:
+                    filename = extract_filename(source_name)
+
+                    if filename not in existing:
+                        missing_files.append(filename)
+
+                    task["file_upload"] = filename
+                    task.setdefault("data", {})
+                    task["data"]["audio"] = args.audio_url_template.format(filename=filename)
+
+                out.write(b",\n" if count else b"\n")
+                out.write(encode_task(task))
+                count += 1
+            out.write(b"\n]" if count else b"]")
+        # NamedTemporaryFile is created 0600; give the output the usual mode.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp.name, 0o666 & ~umask)
+        os.replace(tmp.name, args.output_json)
+    except BaseException:
+        Path(tmp.name).unlink(missing_ok=True)
+        raise
 
     print(f"Wrote {args.output_json}")
     if missing_files: